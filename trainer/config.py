@@ -4,6 +4,25 @@ import os
 FINE_TUNE_DIR = "fine_tune_files"
 RAW_DATA_DIR = os.path.join(FINE_TUNE_DIR, "raw_data")
 PREPARED_DATA_DIR = os.path.join(FINE_TUNE_DIR, "prepared_data")
+# Entpackte Kopien komprimierter Dateien für externe Werkzeuge (openai CLI)
+UNPACKED_DATA_DIR = os.path.join(FINE_TUNE_DIR, "unpacked_data")
+
+# Profile einzelner Menüaktionen (HSA_PROFILE=1 oder --profile)
+PROFILE_DIR = os.path.join(FINE_TUNE_DIR, "profiles")
+
+# Fragen-Index (Lookup ohne Modellaufruf)
+QUESTION_INDEX_FILE = os.path.join(FINE_TUNE_DIR, "question_index.bin")
 
 # Seps
 TRAINING_RAW_DATA_SEPARATOR = "#####"
+
+# Generierung von Fragen/Antworten: das erste Modell wird bevorzugt, die weiteren sind
+# günstigere Ausweichmodelle, falls alle Schlüssel für das bevorzugte Modell ausgelastet sind
+GENERATION_MODELS = ["text-davinci-003", "text-curie-001"]
+GENERATION_MAX_TOKENS = 500
+GENERATION_API_BASE = "https://api.openai.com/v1"
+
+# Format der vorbereiteten Trainingsdaten (.jsonl)
+PROMPT_END = "\n\n###\n\n"
+COMPLETION_START = " "
+COMPLETION_END = " END"
@@ -0,0 +1,135 @@
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Lokaler Ersatz für den /v1/completions-Endpunkt, um den RequestScheduler ohne
+# Kosten gegen unterschiedliche Kontingente zu testen. Jeder Schlüssel hat pro
+# Modell ein Anfrage-Kontingent je Zeitfenster; darüber hinaus antwortet der
+# Server mit 429 und den gleichen x-ratelimit-* Headern wie die OpenAI-API.
+#
+#   python fake_openai.py --quota sk-test-a=3 --quota sk-test-b=10 --window 5
+#   GENERATION_API_BASE=http://127.0.0.1:8765/v1 OPENAI_API_KEYS=sk-test-a,sk-test-b python main.py
+
+DEFAULT_QUOTA = 60
+DEFAULT_WINDOW = 60.0
+
+
+class FakeQuotaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, quotas=None, default_quota=DEFAULT_QUOTA, window=DEFAULT_WINDOW,
+                 latency=0.0, model_quotas=None):
+        super().__init__(address, _FakeCompletionHandler)
+        self.quotas = dict(quotas or {})
+        self.model_quotas = dict(model_quotas or {})
+        self.default_quota = default_quota
+        self.window = window
+        self.latency = latency
+        self.requests_log = []
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    @property
+    def api_base(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def quota_for(self, key, model):
+        if (key, model) in self.model_quotas:
+            return self.model_quotas[(key, model)]
+        return self.quotas.get(key, self.default_quota)
+
+    def consume(self, key, model):
+        # Gibt (erlaubt, verbleibend, Sekunden bis zum Reset) zurück
+        with self._lock:
+            now = time.monotonic()
+            started, used = self._windows.get((key, model), (now, 0))
+            if now - started >= self.window:
+                started, used = now, 0
+
+            quota = self.quota_for(key, model)
+            allowed = used < quota
+            if allowed:
+                used += 1
+            self._windows[(key, model)] = (started, used)
+            self.requests_log.append((key, model, allowed))
+            return allowed, max(0, quota - used), max(0.0, self.window - (now - started))
+
+
+class _FakeCompletionHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, headers):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/completions"):
+            self._reply(404, {"error": {"message": "Unbekannter Endpunkt"}}, {})
+            return
+
+        key = self.headers.get("Authorization", "").replace("Bearer ", "")
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = payload.get("model", "")
+
+        allowed, remaining, reset = self.server.consume(key, model)
+        headers = {
+            "x-ratelimit-limit-requests": str(self.server.quota_for(key, model)),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-reset-requests": f"{reset:.3f}s",
+        }
+        if not allowed:
+            headers["retry-after"] = f"{reset:.3f}"
+            self._reply(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, headers)
+            return
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        prompt = payload.get("prompt", "")
+        text = f" Frage: Worum geht es? Antwort: {prompt[-40:]}"
+        self._reply(200, {"model": model, "choices": [{"text": text, "index": 0}]}, headers)
+
+
+def start_fake_server(host="127.0.0.1", port=0, **kwargs):
+    # Startet den Server im Hintergrund; port=0 wählt einen freien Port
+    server = FakeQuotaServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _parse_quota(value):
+    key, _, quota = value.rpartition("=")
+    if not key:
+        raise argparse.ArgumentTypeError("Format: SCHLÜSSEL=ANZAHL")
+    return key, int(quota)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokaler Fake-Endpunkt für /v1/completions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--quota", type=_parse_quota, action="append", default=[],
+                        help="Anfragen pro Zeitfenster für einen Schlüssel, z.B. sk-test-a=5")
+    parser.add_argument("--default-quota", type=int, default=DEFAULT_QUOTA)
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW, help="Zeitfenster in Sekunden")
+    parser.add_argument("--latency", type=float, default=0.0, help="Künstliche Antwortzeit in Sekunden")
+    args = parser.parse_args()
+
+    fake_server = FakeQuotaServer((args.host, args.port), quotas=dict(args.quota),
+                                  default_quota=args.default_quota, window=args.window, latency=args.latency)
+    print(f"Fake-OpenAI läuft unter {fake_server.api_base}")
+    try:
+        fake_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -2,10 +2,13 @@ import openai
 import os
 import json
 import datetime
+import functools
 import subprocess
 from dotenv import load_dotenv
-from config import RAW_DATA_DIR, PREPARED_DATA_DIR, TRAINING_RAW_DATA_SEPARATOR
+from config import RAW_DATA_DIR, PREPARED_DATA_DIR, TRAINING_RAW_DATA_SEPARATOR, PROMPT_END, COMPLETION_START, COMPLETION_END
 from utils import LogLevel, custom_print, print_header, custom_input
+from scheduler import generate_completions, load_generation_models
+from storage import open_data_file, list_data_files, data_basename, split_compression, default_compression_suffix, ensure_plain_file, existing_variants, remove_other_variants
 
 
 def get_user_confirmation(message):
@@ -63,6 +66,7 @@ def get_openai_key():
 
 def handle_openai_errors(func):
     # https://platform.openai.com/docs/guides/error-codes/python-library-error-types
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
@@ -90,8 +94,7 @@ def merge_training_files():
 
     while True:
         # Dateien auflisten
-        all_files = [f for f in os.listdir(
-            PREPARED_DATA_DIR) if f.endswith('.jsonl')]
+        all_files = list_data_files(PREPARED_DATA_DIR, '.jsonl')
         available_files = [f for f in all_files if f not in selected_files]
 
         # Abbrechen, wenn keine Dateien mehr vorhanden sind
@@ -131,7 +134,7 @@ def merge_training_files():
     # Inhalte der Dateien zusammenführen
     merged_data = []
     for file in selected_files:
-        with open(os.path.join(PREPARED_DATA_DIR, file), 'r', encoding='utf-8') as f:
+        with open_data_file(os.path.join(PREPARED_DATA_DIR, file), 'r') as f:
             merged_data.extend([json.loads(line) for line in f])
 
     # Inhalte anzeigen
@@ -139,20 +142,36 @@ def merge_training_files():
     for item in merged_data:
         print(json.dumps(item))
 
+    # Name der gespeicherten Datei ohne Komprimierungsendung (None = nicht gespeichert)
+    merged_name = None
+
     # Bestätigung zum Speichern
     if get_user_confirmation("Ist die Zusammenführung korrekt und soll gespeichert werden?"):
         filename = input(
-            "\nBitte geben Sie den gewünschten Dateinamen ohne Erweiterung ein: ") + ".jsonl"
-        with open(os.path.join(PREPARED_DATA_DIR, filename), 'w', encoding='utf-8') as f:
-            for item in merged_data:
-                f.write(json.dumps(item, ensure_ascii=False) + "\n")
-        custom_print(
-            f"\nDaten wurden in {filename} gespeichert.", LogLevel.INFO)
+            "\nBitte geben Sie den gewünschten Dateinamen ohne Erweiterung ein: ") + ".jsonl" + default_compression_suffix()
+        file_path = os.path.join(PREPARED_DATA_DIR, filename)
+        existing = [os.path.basename(f) for f in existing_variants(file_path)]
+
+        if existing and not get_user_confirmation(f"Die Datei(en) {', '.join(existing)} existieren bereits. Möchten Sie sie überschreiben?"):
+            custom_print("\nSpeicherung abgebrochen.", LogLevel.INFO)
+        else:
+            with open_data_file(file_path, 'w') as f:
+                for item in merged_data:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            remove_other_variants(file_path)
+            merged_name = split_compression(filename)[0]
+            custom_print(
+                f"\nDaten wurden in {filename} gespeichert.", LogLevel.INFO)
 
     # Bestätigung zum Löschen der alten Dateien
     if get_user_confirmation("Möchten Sie die ursprünglichen Dateien löschen?"):
         for file in selected_files:
-            os.remove(os.path.join(PREPARED_DATA_DIR, file))
+            # Die zusammengeführte Datei selbst (in jeder Komprimierungsvariante) bleibt erhalten;
+            # bereits durch die Speicherung ersetzte Varianten existieren nicht mehr
+            if split_compression(file)[0] == merged_name:
+                continue
+            if os.path.exists(os.path.join(PREPARED_DATA_DIR, file)):
+                os.remove(os.path.join(PREPARED_DATA_DIR, file))
         custom_print(
             "\nDie ausgewählten Dateien wurden gelöscht.", LogLevel.INFO)
 
@@ -189,8 +208,7 @@ def train_model():
         training_file = custom_input(
             "\nBitte geben Sie den vollständigen Pfad zur Trainingsdatei ein: ")
     elif file_select_method == 2:
-        files = [f for f in os.listdir(
-            PREPARED_DATA_DIR) if f.endswith('.jsonl')]
+        files = list_data_files(PREPARED_DATA_DIR, '.jsonl')
         for idx, file in enumerate(files, 1):
             print(f"{idx}. {file}")
 
@@ -201,6 +219,8 @@ def train_model():
         custom_print("Ungültige Auswahlmethode.", LogLevel.ERROR)
         return
 
+    training_file = ensure_plain_file(training_file)
+
     if get_user_confirmation(f"Fine-Tuning für Modell '{chosen_model}' mit der Datei '{training_file}' starten?"):
         command = f"openai api fine_tunes.create -t {training_file} -m {chosen_model}"
         open_terminal_with_command(command)
@@ -260,8 +280,7 @@ def create_fine_tuned_model():
         training_file = custom_input(
             "\nBitte geben Sie den vollständigen Pfad zur Trainingsdatei ein: ")
     elif file_select_method == 2:
-        files = [f for f in os.listdir(
-            PREPARED_DATA_DIR) if f.endswith('.jsonl')]
+        files = list_data_files(PREPARED_DATA_DIR, '.jsonl')
         for idx, file in enumerate(files, 1):
             print(f"{idx}. {file}")
 
@@ -272,6 +291,8 @@ def create_fine_tuned_model():
         custom_print("Ungültige Auswahlmethode.", LogLevel.ERROR)
         return
 
+    training_file = ensure_plain_file(training_file)
+
     suffix = custom_input("Geben Sie einen Suffix für Ihr Modell ein: ")
 
     if get_user_confirmation(f"Fine-Tuning für Modell '{chosen_model}' mit der Datei '{training_file}' und Suffix '{suffix}' starten?"):
@@ -339,11 +360,11 @@ def create_training_file():
         # Absoluter Pfad
         file_path = custom_input(
             "Bitte geben Sie den absoluten Pfad Ihrer .txt-Datei an: ")
-        raw_data_filename = os.path.splitext(os.path.basename(file_path))[0]
+        raw_data_filename = data_basename(file_path)
 
     elif choice == 1:
        # Definiertes Verzeichnis
-        files = [f for f in os.listdir(RAW_DATA_DIR) if f.endswith(".txt")]
+        files = list_data_files(RAW_DATA_DIR, ".txt")
         if not files:
             custom_print(
                 "Keine .txt-Dateien im definierten Verzeichnis gefunden.", LogLevel.ERROR)
@@ -358,7 +379,7 @@ def create_training_file():
                 files)
         )
         file_path = os.path.join(RAW_DATA_DIR, files[choice - 1])
-        raw_data_filename = os.path.splitext(files[choice - 1])[0]
+        raw_data_filename = data_basename(files[choice - 1])
     else:
         custom_print("Ungültige Asuwahl.", LogLevel.ERROR)
         return
@@ -366,7 +387,7 @@ def create_training_file():
     ############################################
     # Schritt 3: Datei lesen und in Abschnitte aufteilen
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
+        with open_data_file(file_path, 'r') as file:
             content = file.read()
             sections = content.split(TRAINING_RAW_DATA_SEPARATOR)
             sections = [section.strip()
@@ -417,7 +438,7 @@ def create_training_file():
     ############################################
     # Schritt 5: ChatGPT Frage-/Antwortgenerierung
 
-    if not get_user_confirmation("\nMöchten Sie den Prozess zur Generierung von Fragen und Antworten mithilfe von GPT (Modell: text-davinci-003) starten? Dies kann einige Zeit dauern und ist mit Kosten verbunden."):
+    if not get_user_confirmation(f"\nMöchten Sie den Prozess zur Generierung von Fragen und Antworten mithilfe von GPT (Modelle: {', '.join(load_generation_models())}) starten? Dies kann einige Zeit dauern und ist mit Kosten verbunden."):
         custom_print(
             "Generierung vom Benutzer abgebrochen. Rückkehr zum Menü.", LogLevel.INFO)
         return
@@ -436,17 +457,23 @@ def create_training_file():
 
     section_responses = {}
 
-    for idx, section in enumerate(sections):
-        prompt = 'Generiere Fragen und Antworten aus dem gegebenen Text, nutze alle Informationen. Verwende ausnahmslos das Format: Frage: Antwort:. Text: ' + section
-        response = openai.Completion.create(
-            model="text-davinci-003",
-            prompt=prompt,
-            max_tokens=500
-        )
-        chatgpt_response = response.choices[0].text.strip()
+    # Die Abschnitte werden parallel auf alle konfigurierten Schlüssel verteilt (siehe scheduler.py),
+    # die Ergebnisse kommen in der Reihenfolge der Abschnitte zurück.
+    prompts = ['Generiere Fragen und Antworten aus dem gegebenen Text, nutze alle Informationen. Verwende ausnahmslos das Format: Frage: Antwort:. Text: ' + section
+               for section in sections]
+    results = generate_completions(prompts)
+
+    for idx, result in enumerate(results):
+        if result.error:
+            custom_print(
+                f"\n---Abschnitt {idx+1} konnte nicht generiert werden und wird übersprungen: {result.error}\n", LogLevel.ERROR)
+            section_responses[idx + 1] = []
+            continue
+
+        chatgpt_response = result.text.strip()
 
         custom_print(
-            f"\n---GPT-Antwort für Abschnitt {idx+1}:\n{chatgpt_response}\n")
+            f"\n---GPT-Antwort für Abschnitt {idx+1} ({result.model}):\n{chatgpt_response}\n")
 
         lines = chatgpt_response.split("\n")
         lines_joined = " ".join(lines)
@@ -482,12 +509,6 @@ def create_training_file():
 
 
 def format_and_save_questions(section_responses, raw_data_filename):
-    # Das Endzeichen für den prompt:
-    PROMPT_END = "\n\n###\n\n"
-    # Start und Ende des completion-Teils:
-    COMPLETION_START = " "
-    COMPLETION_END = " END"
-
     # Sammeln der Ausgabe für den Benutzer:
     output_list = []
 
@@ -516,11 +537,14 @@ def format_and_save_questions(section_responses, raw_data_filename):
                 "\nBitte geben Sie den gewünschten Dateinamen ohne Erweiterung an: ") + ".jsonl"
         else:
             filename = raw_data_filename + ".jsonl"
+        filename += default_compression_suffix()
 
         file_path = os.path.join(PREPARED_DATA_DIR, filename)
 
-        if os.path.exists(file_path):
-            if get_user_confirmation(f"Die Datei '{filename}' existiert bereits. Möchten Sie sie überschreiben?"):
+        # Auch anders komprimierte Varianten (z.B. x.jsonl neben x.jsonl.gz) zählen als vorhanden
+        existing = [os.path.basename(f) for f in existing_variants(file_path)]
+        if existing:
+            if get_user_confirmation(f"Die Datei(en) {', '.join(existing)} existieren bereits. Möchten Sie sie überschreiben?"):
                 break
             else:
                 custom_print(
@@ -530,14 +554,15 @@ def format_and_save_questions(section_responses, raw_data_filename):
             break
 
     # Die generierten Daten in eine Datei speichern:
-    with open(file_path, 'w', encoding='utf-8') as f:
+    with open_data_file(file_path, 'w') as f:
         for item in output_list:
             f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    remove_other_variants(file_path)
 
     custom_print(f"\nDaten wurden in {file_path} gespeichert.", LogLevel.INFO)
 
     if get_user_confirmation("\nMöchten Sie eine OpenAI-Validierung durchführen?"):
-        command = f'start cmd /k openai tools fine_tunes.prepare_data -f {file_path}'
+        command = f'start cmd /k openai tools fine_tunes.prepare_data -f {ensure_plain_file(file_path)}'
         open_terminal_with_command(command)
 
 
@@ -570,7 +595,7 @@ def read_and_prepare_data():
         file_path = custom_input(
             "Bitte geben Sie den vollständigen Pfad zur TXT-Datei ein: ")
         # Datei einlesen
-    with open(file_path, 'r', encoding='utf-8') as file:
+    with open_data_file(file_path, 'r') as file:
         content = file.read()
 
     # Entfernen Sie alle Zeilenumbrüche, da sie in diesem Fall nicht nützlich sind
@@ -590,5 +615,5 @@ def read_and_prepare_data():
             answer = splitted[1].strip()
             section_responses[current_section].extend([question, answer])
 
-    raw_data_filename = os.path.basename(file_path)
+    raw_data_filename = split_compression(os.path.basename(file_path))[0]
     format_and_save_questions(section_responses, raw_data_filename)
@@ -0,0 +1,468 @@
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import time
+import array
+import struct
+import bisect
+import unicodedata
+import zlib
+import tempfile
+from collections import Counter, namedtuple
+from itertools import chain
+from config import PREPARED_DATA_DIR, QUESTION_INDEX_FILE, PROMPT_END, COMPLETION_START, COMPLETION_END
+from utils import LogLevel, custom_print, print_header
+from storage import open_data_file, list_data_files
+
+# Aufbau der Indexdatei (alle Zahlen als uint32 in nativer Byte-Reihenfolge):
+#   Header | Einträge | Hash-Slots | Term-Hashes | Term-Offsets | Postings | Stopp-N-Gramme
+#   | Stopp-Masken (Bytes) | Text
+# Einträge: (frage_off, frage_len, norm_off, norm_len, antwort_off, antwort_len, anzahl_ngramme)
+# Hash-Slots: offene Adressierung über crc32(normalisierte Frage), Wert = Eintrag + 1 (0 = leer)
+# Term-Hashes sind sortiert, Term-Offsets zeigen (CSR) in die Postings-Liste.
+# Stopp-N-Gramme kommen in zu vielen Fragen vor (" di", "wie", ...). Sie haben keine Postings,
+# stattdessen hat jeder Eintrag eine Bitmaske (Bit i = enthält Stopp-N-Gramm i). Für den Dice-Wert
+# zählen sie wie alle anderen N-Gramme (anzahl_ngramme enthält sie), damit sich Fragen, die sich
+# nur in häufigen Wörtern unterscheiden ("beginnt"/"endet"), weiterhin unterscheiden.
+INDEX_MAGIC = b"HSAQIDX3"
+INDEX_HEADER = struct.Struct("=8sIIIIIII")
+ENTRY_FIELDS = 7
+NGRAM_SIZE = 3
+DEFAULT_MIN_SCORE = 0.8
+
+# Ein N-Gramm wird zum Stopp-N-Gramm, wenn es in mehr als
+# max(STOP_GRAM_MIN_DF, STOP_GRAM_MAX_RATIO * Anzahl Fragen) Fragen vorkommt
+STOP_GRAM_MIN_DF = 32
+STOP_GRAM_MAX_RATIO = 0.01
+# Höchstens so viele (die häufigsten) werden Stopp-N-Gramme; begrenzt die Maskengröße pro Eintrag
+STOP_GRAM_LIMIT = 512
+
+LookupMatch = namedtuple("LookupMatch", ["question", "answer", "score"])
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text):
+    # Groß-/Kleinschreibung, Satzzeichen und Leerraum sollen einen Treffer nicht verhindern
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def question_ngrams(normalized, ngram_size=NGRAM_SIZE):
+    padded = f" {normalized} "
+    if len(padded) <= ngram_size:
+        return {zlib.crc32(padded.encode("utf-8"))}
+    return {zlib.crc32(padded[i:i + ngram_size].encode("utf-8"))
+            for i in range(len(padded) - ngram_size + 1)}
+
+
+def _strip_affixes(text, prefix, suffix):
+    if prefix and text.startswith(prefix):
+        text = text[len(prefix):]
+    if suffix and text.endswith(suffix):
+        text = text[:-len(suffix)]
+    return text.strip()
+
+
+def read_prepared_pairs(directory=PREPARED_DATA_DIR):
+    # Liefert (Frage, Antwort) aus allen .jsonl-Dateien (auch komprimiert) in fester Reihenfolge
+    for filename in sorted(list_data_files(directory, ".jsonl")):
+        with open_data_file(os.path.join(directory, filename), 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                question = _strip_affixes(item.get("prompt", ""), "", PROMPT_END)
+                answer = _strip_affixes(
+                    item.get("completion", ""), COMPLETION_START, COMPLETION_END)
+                if question and answer:
+                    yield question, answer
+
+
+def write_question_index(pairs, index_file=QUESTION_INDEX_FILE, ngram_size=NGRAM_SIZE):
+    text = bytearray()
+    entries = array.array("I")
+    entry_grams = []
+    seen = set()
+
+    def append_text(value):
+        data = value.encode("utf-8")
+        offset = len(text)
+        text.extend(data)
+        return offset, len(data)
+
+    for question, answer in pairs:
+        normalized = normalize_question(question)
+        # Doppelte Fragen: der erste Eintrag gewinnt
+        if not normalized or normalized in seen:
+            continue
+        seen.add(normalized)
+
+        grams = question_ngrams(normalized, ngram_size)
+        entries.extend(append_text(question))
+        entries.extend(append_text(normalized))
+        entries.extend(append_text(answer))
+        entries.append(len(grams))
+        entry_grams.append((normalized, grams))
+
+    entry_count = len(entry_grams)
+
+    # Exakt-Treffer: Hash-Tabelle mit Zweierpotenz-Größe und max. 50 % Füllgrad
+    slot_count = 1
+    while slot_count < entry_count * 2:
+        slot_count *= 2
+    slots = array.array("I", [0]) * slot_count
+    mask = slot_count - 1
+
+    # N-Gramm-Index: Hash -> Liste der Einträge
+    postings_by_term = {}
+    for entry_id, (normalized, grams) in enumerate(entry_grams):
+        slot = zlib.crc32(normalized.encode("utf-8")) & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = entry_id + 1
+
+        for gram in grams:
+            postings_by_term.setdefault(gram, []).append(entry_id)
+
+    # Sehr häufige N-Gramme erzeugen lange Listen, die jede unscharfe Abfrage durchlaufen müsste
+    max_df = max(STOP_GRAM_MIN_DF, int(STOP_GRAM_MAX_RATIO * entry_count))
+    frequent = sorted((term for term, entry_ids in postings_by_term.items() if len(entry_ids) > max_df),
+                      key=lambda term: (-len(postings_by_term[term]), term))
+    stop_hashes = array.array("I", frequent[:STOP_GRAM_LIMIT])
+    stop_bits = {term: 1 << bit for bit, term in enumerate(stop_hashes)}
+    mask_size = _stop_mask_size(len(stop_hashes))
+    stop_masks = bytearray()
+    for _, grams in entry_grams:
+        mask = sum(stop_bits[gram] for gram in grams if gram in stop_bits)
+        stop_masks.extend(mask.to_bytes(mask_size, "little"))
+    for term in stop_hashes:
+        del postings_by_term[term]
+
+    term_hashes = array.array("I", sorted(postings_by_term))
+    term_offsets = array.array("I", [0])
+    postings = array.array("I")
+    for term in term_hashes:
+        postings.extend(postings_by_term[term])
+        term_offsets.append(len(postings))
+
+    header = INDEX_HEADER.pack(INDEX_MAGIC, ngram_size, entry_count, slot_count,
+                               len(term_hashes), len(postings), len(text), len(stop_hashes))
+
+    # Erst vollständig schreiben, dann ersetzen, damit laufende Leser nie eine halbe Datei sehen
+    tmp_file = index_file + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(header)
+        for section in (entries, slots, term_hashes, term_offsets, postings, stop_hashes):
+            section.tofile(f)
+        f.write(stop_masks)
+        f.write(text)
+    os.replace(tmp_file, index_file)
+
+    return entry_count
+
+
+def _stop_mask_size(stop_count):
+    return (stop_count + 7) // 8
+
+
+class QuestionIndex:
+    # Speicherabgebildeter (mmap) Fragen-Index; Abfragen lesen direkt aus der Datei
+
+    def __init__(self, index_file=QUESTION_INDEX_FILE):
+        self._file = open(index_file, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Die Indexdatei '{index_file}' ist leer.")
+
+        (magic, self.ngram_size, self.entry_count, self._slot_count, term_count,
+         posting_count, text_size, stop_count) = INDEX_HEADER.unpack_from(self._mmap, 0)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"'{index_file}' ist keine gültige Indexdatei (ggf. mit Menüpunkt 8 neu erstellen).")
+
+        view = self._view = memoryview(self._mmap)
+        offset = INDEX_HEADER.size
+
+        def section(count):
+            nonlocal offset
+            size = count * 4
+            part = view[offset:offset + size].cast("I")
+            offset += size
+            return part
+
+        self._entries = section(self.entry_count * ENTRY_FIELDS)
+        self._slots = section(self._slot_count)
+        self._term_hashes = section(term_count)
+        self._term_offsets = section(term_count + 1)
+        self._postings = section(posting_count)
+        stop_hashes = section(stop_count)
+        self._stop_bits = {term: 1 << bit for bit, term in enumerate(stop_hashes.tolist())}
+        stop_hashes.release()
+        self._mask_size = _stop_mask_size(stop_count)
+        self._stop_masks = view[offset:offset + self.entry_count * self._mask_size]
+        offset += len(self._stop_masks)
+        # Term-Hash -> Position; erspart pro N-Gramm eine binäre Suche über das mmap
+        self._term_positions = {term: position for position, term in enumerate(self._term_hashes.tolist())}
+        self._text = view[offset:offset + text_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.entry_count
+
+    def close(self):
+        # Alle memoryviews freigeben, sonst lässt sich das mmap nicht schließen
+        for name in ("_entries", "_slots", "_term_hashes", "_term_offsets", "_postings", "_stop_masks",
+                     "_text", "_view"):
+            part = getattr(self, name, None)
+            if part is not None:
+                part.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def _field(self, entry_id, field):
+        base = entry_id * ENTRY_FIELDS + field
+        offset, length = self._entries[base], self._entries[base + 1]
+        return self._text[offset:offset + length]
+
+    def _match(self, entry_id, score):
+        return LookupMatch(str(self._field(entry_id, 0), "utf-8"),
+                           str(self._field(entry_id, 4), "utf-8"), score)
+
+    def exact(self, question):
+        normalized = normalize_question(question).encode("utf-8")
+        if not self._slot_count:
+            return None
+
+        mask = self._slot_count - 1
+        slot = zlib.crc32(normalized) & mask
+        while True:
+            entry_id = self._slots[slot]
+            if not entry_id:
+                return None
+            if self._field(entry_id - 1, 2) == normalized:
+                return self._match(entry_id - 1, 1.0)
+            slot = (slot + 1) & mask
+
+    def search(self, question, limit=5, min_score=0.0):
+        # Ähnlichkeit = Dice-Koeffizient über alle Zeichen-N-Gramme (auch Stopp-N-Gramme)
+        grams = question_ngrams(normalize_question(question), self.ngram_size)
+        query_size = len(grams)
+        term_positions, term_offsets, all_postings = self._term_positions, self._term_offsets, self._postings
+        stop_bits = self._stop_bits
+        lists = []
+        query_mask = 0
+        for gram in grams:
+            bit = stop_bits.get(gram)
+            if bit is not None:
+                query_mask |= bit
+                continue
+            term = term_positions.get(gram)
+            if term is not None:
+                lists.append(all_postings[term_offsets[term]:term_offsets[term + 1]])
+        stop_count = bin(query_mask).count("1")
+        # Seltene N-Gramme zuerst (wie IDF): sie grenzen die Kandidaten am stärksten ein
+        lists.sort(key=len)
+
+        # Präfix-Filter: Dice >= min_score erfordert mindestens min_shared gemeinsame N-Gramme,
+        # daher muss jeder Treffer in einer der (query_size - min_shared + 1) seltensten Listen vorkommen.
+        # N-Gramme, die im Index fehlen, zählen dabei als leere Listen. Stopp-N-Gramme wären die
+        # längsten Listen; sie werden nie durchlaufen, sondern über die Masken der Kandidaten gezählt.
+        min_shared = math.ceil(min_score * query_size / (2.0 - min_score)) if min_score > 0 else 1
+        prefix = min(len(lists), max(0, len(lists) + stop_count - min_shared + 1))
+
+        # Zählen über Counter/Set-Operationen, damit die Schleifen in C laufen
+        shared = Counter(chain.from_iterable(lists[:prefix]))
+
+        # Restliche (häufige) Listen nur noch für die bereits gefundenen Kandidaten zählen
+        candidates = set(shared)
+        hits = []
+        for postings in lists[prefix:]:
+            if len(candidates) * 16 < len(postings):
+                # Wenige Kandidaten: binäre Suche in der (aufsteigend sortierten) Liste
+                size = len(postings)
+                for entry_id in candidates:
+                    position = bisect.bisect_left(postings, entry_id)
+                    if position < size and postings[position] == entry_id:
+                        hits.append(entry_id)
+            else:
+                hits.extend(candidates.intersection(postings))
+        shared.update(hits)
+
+        if query_mask:
+            masks, mask_size = self._stop_masks, self._mask_size
+            for entry_id in candidates:
+                start = entry_id * mask_size
+                common = int.from_bytes(masks[start:start + mask_size], "little") & query_mask
+                if common:
+                    shared[entry_id] += bin(common).count("1")
+
+        entries = self._entries
+        scored = []
+        for entry_id, count in shared.items():
+            score = 2.0 * count / (query_size + entries[entry_id * ENTRY_FIELDS + 6])
+            if score >= min_score:
+                scored.append((score, entry_id))
+
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self._match(entry_id, score) for score, entry_id in scored[:limit]]
+
+    def lookup(self, question, min_score=DEFAULT_MIN_SCORE):
+        # Exakter Treffer zuerst, sonst die ähnlichste Frage oberhalb von min_score
+        match = self.exact(question)
+        if match:
+            return match
+        matches = self.search(question, limit=1, min_score=min_score)
+        return matches[0] if matches else None
+
+
+def load_question_index(index_file=QUESTION_INDEX_FILE):
+    return QuestionIndex(index_file)
+
+
+def build_question_index():
+    print_header("Erstellung des Fragen-Index (Lookup ohne Modellaufruf)")
+
+    start = time.perf_counter()
+    try:
+        entry_count = write_question_index(read_prepared_pairs())
+    except (OSError, ValueError) as e:
+        custom_print(f"Fehler beim Erstellen des Index: {e}", LogLevel.ERROR)
+        return
+    duration = time.perf_counter() - start
+
+    custom_print(
+        f"\n{entry_count} Fragen wurden in {duration:.2f} s indexiert.", LogLevel.INFO)
+    custom_print(
+        f"Index gespeichert in {QUESTION_INDEX_FILE} ({os.path.getsize(QUESTION_INDEX_FILE)} Bytes).", LogLevel.INFO)
+
+
+def _benchmark_queries(index):
+    # Exakte Fragen (auch nach Normalisierung), gekürzte Fragen, Tippfehler und Fehlanfragen
+    queries = []
+    for entry_id in range(index.entry_count):
+        question = str(index._field(entry_id, 0), "utf-8")
+        queries.append(question)
+        queries.append(question.upper().rstrip("?") + " ?")
+        queries.append(question[:max(1, len(question) - 3)])
+        middle = len(question) // 2
+        queries.append(question[:middle] + question[middle + 1:middle + 2] + question[middle] + question[middle + 2:])
+    queries.append("Wie ist das Wetter heute auf dem Mond?")
+    return queries
+
+
+def _print_latencies(label, timings, hits):
+    if not timings:
+        print(f"{label}: keine Abfragen")
+        return
+    timings.sort()
+    p50 = timings[len(timings) // 2] / 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] / 1000
+    print(f"{label}: {len(timings)} Abfragen, Trefferquote {hits / len(timings):.1%}, "
+          f"p50 {p50:.1f} µs, p99 {p99:.1f} µs")
+
+
+def _ranking_pairs(modules=1000):
+    # Fragen, die sich nur in häufigen Wörtern unterscheiden (beginnt/endet); die
+    # gemeinsamen N-Gramme sind hier fast alle Stopp-N-Gramme
+    for module in range(modules):
+        name = f"Modul{chr(65 + module % 26)}{module}"
+        yield f"Wann beginnt die Vorlesung {name}?", f"beginnt:{name}"
+        yield f"Wann endet die Vorlesung {name}?", f"endet:{name}"
+        yield f"Wo findet die Vorlesung {name} statt?", f"ort:{name}"
+
+
+def check_question_ranking():
+    # Regressionsprüfung: eine Frage darf nicht auf eine nur in häufigen Wörtern
+    # abweichende Frage abgebildet werden; liefert die Liste der Fehler
+    checks = [
+        ("Wann endet die Vorlesung ModulC2?", "endet:ModulC2"),
+        ("Wann endete die Vorlesung ModulC2?", "endet:ModulC2"),
+        ("Wann beginnt die Vorlesung ModulC2", "beginnt:ModulC2"),
+        ("wann beginnt die vorlesung modull11", "beginnt:ModulL11"),
+        ("Wo findet die Vorlesung ModulC2 statt", "ort:ModulC2"),
+    ]
+    errors = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_file = os.path.join(tmp_dir, "ranking.idx")
+        write_question_index(_ranking_pairs(), index_file)
+        with QuestionIndex(index_file) as index:
+            for question, expected in checks:
+                matches = index.search(question, limit=2)
+                if not matches or matches[0].answer != expected:
+                    errors.append(f"'{question}': erwartet {expected}, erhalten "
+                                  f"{matches[0].answer if matches else 'kein Treffer'}")
+                elif len(matches) > 1 and matches[1].score >= matches[0].score:
+                    errors.append(f"'{question}': kein eindeutiger Treffer ({matches[0].score:.2f})")
+                elif not index.lookup(question):
+                    errors.append(f"'{question}': lookup() liefert keinen Treffer")
+    return errors
+
+
+def benchmark_question_index(min_lookups=20000):
+    print_header("Benchmark des Fragen-Index")
+
+    if not os.path.exists(QUESTION_INDEX_FILE):
+        custom_print(
+            "Kein Index gefunden. Bitte zuerst den Fragen-Index erstellen.", LogLevel.ERROR)
+        return
+
+    with load_question_index() as index:
+        if not len(index):
+            custom_print("Der Index enthält keine Fragen.", LogLevel.ERROR)
+            return
+
+        # Getrennt messen: exakte Treffer sind schnell, die unscharfe Suche ist der teure Pfad
+        queries = [(query, index.exact(query) is not None) for query in _benchmark_queries(index)]
+        rounds = max(1, -(-min_lookups // len(queries)))
+        timings = {True: [], False: []}
+        hits = {True: 0, False: 0}
+
+        for _ in range(rounds):
+            for query, is_exact in queries:
+                start = time.perf_counter_ns()
+                match = index.lookup(query)
+                timings[is_exact].append(time.perf_counter_ns() - start)
+                if match:
+                    hits[is_exact] += 1
+
+        stop_gram_count = len(index._stop_bits)
+
+    lookups = len(timings[True]) + len(timings[False])
+    total_seconds = (sum(timings[True]) + sum(timings[False])) / 1e9
+
+    custom_print(f"\nFragen im Index: {len(index)} (Stopp-N-Gramme: {stop_gram_count})", LogLevel.INFO)
+    print(f"Abfragen: {lookups}")
+    print(f"Lookups pro Sekunde: {lookups / total_seconds:,.0f}")
+    _print_latencies("Exakte Treffer", timings[True], hits[True])
+    _print_latencies("Unscharfe Suche", timings[False], hits[False])
+
+    errors = check_question_ranking()
+    for error in errors:
+        custom_print(f"Rangfolge falsch: {error}", LogLevel.ERROR)
+    if not errors:
+        custom_print("Rangfolge-Prüfung (beginnt/endet) bestanden.", LogLevel.INFO)
+
+
+if __name__ == "__main__":
+    # Schnelltest: python lookup.py "Frage ..."
+    if len(sys.argv) < 2:
+        custom_print("Aufruf: python lookup.py \"Frage\"", LogLevel.ERROR)
+        sys.exit(1)
+    with load_question_index() as question_index:
+        result = question_index.lookup(" ".join(sys.argv[1:]))
+        print(result.answer if result else "Kein Treffer.")
@@ -2,14 +2,18 @@ import openai
 from dotenv import load_dotenv
 from utils import LogLevel, custom_print, create_directory, print_header
 from gpt import list_fine_tuned_models, create_fine_tuned_model, delete_fine_tuned_model, get_openai_key, create_training_file, train_model, merge_training_files, read_and_prepare_data
-from config import FINE_TUNE_DIR, RAW_DATA_DIR, PREPARED_DATA_DIR
+from lookup import build_question_index, benchmark_question_index
+from storage import benchmark_storage_codecs, check_data_compression
+from scheduler import load_max_in_flight
+from profiling import profiling_enabled, run_profiled
+from config import FINE_TUNE_DIR, RAW_DATA_DIR, PREPARED_DATA_DIR, UNPACKED_DATA_DIR
 
 def exit_program():
     custom_print("Auf Wiedersehen!", LogLevel.INFO)
     exit()
 
 def create_required_directories():
-    for directory in [FINE_TUNE_DIR, RAW_DATA_DIR, PREPARED_DATA_DIR]:
+    for directory in [FINE_TUNE_DIR, RAW_DATA_DIR, PREPARED_DATA_DIR, UNPACKED_DATA_DIR]:
         create_directory(directory)
 
 def show_main_menu():
@@ -21,6 +25,9 @@ def show_main_menu():
         "5": "Fine-Tuning-Modell erstellen",
         "6": "Fine-Tuning-Modell löschen",
         "7": "Vorbereitete Fragen und Antworten verwenden (Frage: Antwort:)",
+        "8": "Fragen-Index für Lookup ohne Modell erstellen",
+        "9": "Fragen-Index Benchmark (Lookups/s, p99-Latenz)",
+        "10": "Speicherformate Benchmark (gzip/xz/zstd)",
         "q": "Beenden"
     }
 
@@ -46,6 +53,9 @@ def main():
         "5": create_fine_tuned_model,
         "6": delete_fine_tuned_model,
         "7": read_and_prepare_data,
+        "8": build_question_index,
+        "9": benchmark_question_index,
+        "10": benchmark_storage_codecs,
         "q": exit_program
     }
 
@@ -58,13 +68,19 @@ def main():
 
     load_dotenv()
     openai.api_key = get_openai_key()
+    check_data_compression()
+    load_max_in_flight()
 
     while True:
         choice = show_main_menu()
         selected_function = function_mappings.get(choice)
 
         if selected_function:
-            selected_function()
+            # Profiling per --profile oder HSA_PROFILE=1 (siehe profiling.py); Beenden nicht profilieren
+            if profiling_enabled() and selected_function is not exit_program:
+                run_profiled(selected_function)
+            else:
+                selected_function()
         else:
             custom_print("Ungültige Eingabe!", LogLevel.ERROR)
 
@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import datetime
+import threading
+import tracemalloc
+from collections import Counter
+from config import PROFILE_DIR
+from utils import LogLevel, custom_print, create_directory
+
+HOTSPOT_LIMIT = 40
+ALLOCATION_LIMIT = 25
+TRACEBACK_LIMIT = 10
+TRACEMALLOC_FRAMES = 25
+SAMPLE_INTERVAL = 0.005  # Sekunden zwischen zwei Stack-Samples
+
+
+def _switch_enabled(flag, env_var, argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    return flag in argv or os.getenv(env_var, "").strip().lower() in ("1", "true", "ja", "yes")
+
+
+def profiling_enabled(argv=None):
+    return _switch_enabled("--profile", "HSA_PROFILE", argv)
+
+
+def stack_sampling_enabled(argv=None):
+    return _switch_enabled("--profile-stacks", "HSA_PROFILE_STACKS", argv)
+
+
+class StackSampler:
+    # Tastet die Stacks aller Threads periodisch ab und zählt identische Stacks
+    # (Ausgabe im "folded"-Format für flamegraph.pl oder speedscope, Wurzel = Thread-Name)
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"Thread-{thread_id}").replace(";", ","))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# Ab Python 3.12 läuft cProfile über sys.monitoring: ein einziger Profiler erfasst alle
+# Threads, ein zweiter aktiver Profiler ist nicht erlaubt (ValueError)
+PROFILER_SEES_ALL_THREADS = sys.version_info >= (3, 12)
+
+
+class ThreadProfilers:
+    # Vor Python 3.12 erfasst cProfile nur den aktivierenden Thread. Über threading.setprofile
+    # bekommt jeder neu gestartete Thread (z.B. ThreadPoolExecutor-Worker) einen eigenen Profiler.
+
+    def __init__(self):
+        self.profilers = []
+        self._lock = threading.Lock()
+
+    def _start_in_thread(self, frame, event, arg):
+        sys.setprofile(None)  # Hook nur einmal pro Thread ausführen
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return  # anderes Profiling-Werkzeug aktiv, das diesen Thread bereits erfasst
+        with self._lock:
+            self.profilers.append(profiler)
+
+    def start(self):
+        if not PROFILER_SEES_ALL_THREADS:
+            threading.setprofile(self._start_in_thread)
+
+    def stop(self):
+        if not PROFILER_SEES_ALL_THREADS:
+            threading.setprofile(None)
+
+    def merged_stats(self, main_profiler, stream):
+        stats = pstats.Stats(main_profiler, stream=stream)
+        with self._lock:
+            profilers = list(self.profilers)
+        for profiler in profilers:
+            try:
+                stats.add(profiler)
+            except TypeError:
+                pass  # Thread ohne erfasste Aufrufe
+        return stats
+
+
+def _write_hotspots(stats, path, duration, thread_count):
+    with open(path, 'w', encoding='utf-8') as f:
+        threads = "alle" if thread_count is None else thread_count
+        f.write(f"Laufzeit (Wanduhr): {duration:.3f} s, profilierte Threads: {threads}\n")
+        f.write("Zeiten sind über alle Threads summiert.\n\n")
+        stats.stream = f
+        stats.strip_dirs()
+        for sort_key, title in (("cumulative", "kumulierter Zeit"), ("tottime", "Eigenzeit")):
+            f.write(f"===== Top {HOTSPOT_LIMIT} nach {title} ({sort_key}) =====\n")
+            stats.sort_stats(sort_key).print_stats(HOTSPOT_LIMIT)
+
+
+def _write_allocations(snapshot, traced_memory, path):
+    current, peak = traced_memory
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"Aktuell belegt: {current / 1024:.1f} KiB\n")
+        f.write(f"Spitzenwert: {peak / 1024:.1f} KiB\n\n")
+
+        f.write(f"===== Top {ALLOCATION_LIMIT} Allokationen nach Zeile =====\n")
+        for index, stat in enumerate(snapshot.statistics("lineno")[:ALLOCATION_LIMIT], 1):
+            frame = stat.traceback[0]
+            f.write(f"{index:>3}. {frame.filename}:{frame.lineno}: "
+                    f"{stat.size / 1024:.1f} KiB in {stat.count} Blöcken\n")
+
+        f.write(f"\n===== Top {TRACEBACK_LIMIT} Allokationen mit Aufrufkette =====\n")
+        for index, stat in enumerate(snapshot.statistics("traceback")[:TRACEBACK_LIMIT], 1):
+            f.write(f"\n{index}. {stat.size / 1024:.1f} KiB in {stat.count} Blöcken\n")
+            for line in stat.traceback.format():
+                f.write(f"{line}\n")
+
+
+def run_profiled(func, with_stacks=None):
+    # Führt func unter cProfile und tracemalloc aus und schreibt die Berichte in
+    # PROFILE_DIR/<Zeitstempel>_<Funktionsname>/
+    if with_stacks is None:
+        with_stacks = stack_sampling_enabled()
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    output_dir = os.path.join(PROFILE_DIR, f"{timestamp}_{func.__name__}")
+    create_directory(output_dir)
+
+    sampler = StackSampler() if with_stacks else None
+    thread_profilers = ThreadProfilers()
+    profiler = cProfile.Profile()
+
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    if sampler:
+        sampler.start()
+    thread_profilers.start()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        return func()
+    finally:
+        profiler.disable()
+        duration = time.perf_counter() - start
+        thread_profilers.stop()
+        if sampler:
+            sampler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        traced_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = thread_profilers.merged_stats(profiler, sys.stdout)
+        stats.dump_stats(os.path.join(output_dir, "profile.pstats"))
+        _write_hotspots(stats, os.path.join(output_dir, "hotspots.txt"), duration,
+                        None if PROFILER_SEES_ALL_THREADS else len(thread_profilers.profilers) + 1)
+        _write_allocations(snapshot, traced_memory, os.path.join(output_dir, "allocations.txt"))
+        if sampler:
+            sampler.write(os.path.join(output_dir, "stacks.folded"))
+
+        custom_print(f"\nProfil gespeichert in {output_dir}", LogLevel.INFO)
@@ -0,0 +1,339 @@
+import os
+import re
+import json
+import time
+import socket
+import threading
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from config import GENERATION_MODELS, GENERATION_MAX_TOKENS, GENERATION_API_BASE
+from utils import LogLevel, custom_print
+
+# Verteilt Completion-Anfragen auf mehrere API-Schlüssel (und Organisationen).
+# Pro Schlüssel und Modell wird der verbleibende Spielraum aus den x-ratelimit-*
+# Headern der Antworten mitgeführt; neue Anfragen gehen an den Schlüssel mit den
+# meisten noch erlaubten Anfragen. Sind alle Schlüssel für das bevorzugte Modell
+# am Limit, wird auf das nächste (günstigere) Modell ausgewichen. Vorübergehende
+# Fehler (Timeout, 5xx) werden pro Abschnitt mit wachsender Wartezeit wiederholt.
+
+DEFAULT_MAX_IN_FLIGHT = 2
+MAX_RATE_LIMIT_RETRIES = 8
+MAX_TRANSIENT_RETRIES = 4
+TRANSIENT_BACKOFF = 2.0  # Sekunden vor der ersten Wiederholung, danach verdoppelt
+MAX_TRANSIENT_BACKOFF = 30.0
+REQUEST_TIMEOUT = 120
+DEFAULT_RETRY_AFTER = 1.0
+CHARS_PER_TOKEN = 4
+
+ApiKey = namedtuple("ApiKey", ["key", "organization"])
+CompletionResult = namedtuple("CompletionResult", ["text", "headers"])
+# error ist gesetzt, wenn der Abschnitt auch nach allen Wiederholungen nicht generiert werden konnte
+GenerationResult = namedtuple("GenerationResult", ["text", "model", "key_label", "error"], defaults=[None])
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, message, headers=None):
+        super().__init__(message)
+        self.headers = headers or {}
+
+
+class TransientRequestError(Exception):
+    # Timeout, Verbindungsabbruch oder Serverfehler: dieselbe Anfrage kann später gelingen
+    pass
+
+
+def parse_reset_duration(value):
+    # OpenAI liefert z.B. "20ms", "1s", "6m0s" oder "1h2m3.5s"
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_int(headers, name):
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _split_env_list(name):
+    return [item.strip() for item in os.getenv(name, "").split(",")]
+
+
+def mask_key(key):
+    return f"{key[:3]}...{key[-4:]}" if len(key) > 10 else "***"
+
+
+def load_api_keys():
+    # OPENAI_API_KEYS (kommagetrennt) mit passenden OPENAI_ORGANIZATIONS, sonst OPENAI_API_KEY
+    keys = [key for key in _split_env_list("OPENAI_API_KEYS") if key]
+    if not keys:
+        key = os.getenv("OPENAI_API_KEY")
+        if not key:
+            raise ValueError("OpenAI API-Schlüssel nicht gefunden.")
+        keys = [key]
+
+    organizations = _split_env_list("OPENAI_ORGANIZATIONS")
+    organizations += [""] * (len(keys) - len(organizations))
+    if len(keys) == 1 and not organizations[0]:
+        organizations[0] = os.getenv("ORGANIZATION", "")
+    return [ApiKey(key, organization or None) for key, organization in zip(keys, organizations)]
+
+
+def load_generation_models():
+    models = [model for model in _split_env_list("GENERATION_MODELS") if model]
+    return models or list(GENERATION_MODELS)
+
+
+def load_max_in_flight():
+    # GENERATION_MAX_IN_FLIGHT muss eine ganze Zahl >= 1 sein; sonst Standardwert mit Fehlermeldung,
+    # damit die Generierung nicht erst nach der Bestätigung der (kostenpflichtigen) Anfragen scheitert
+    value = os.getenv("GENERATION_MAX_IN_FLIGHT", "").strip()
+    if not value:
+        return DEFAULT_MAX_IN_FLIGHT
+    try:
+        max_in_flight = int(value)
+    except ValueError:
+        max_in_flight = 0
+    if max_in_flight < 1:
+        custom_print(
+            f"Ungültiger Wert '{value}' für GENERATION_MAX_IN_FLIGHT (ganze Zahl ab 1 erwartet), "
+            f"es wird {DEFAULT_MAX_IN_FLIGHT} verwendet.", LogLevel.ERROR)
+        os.environ["GENERATION_MAX_IN_FLIGHT"] = str(DEFAULT_MAX_IN_FLIGHT)
+        return DEFAULT_MAX_IN_FLIGHT
+    return max_in_flight
+
+
+def http_completion(api_base=None):
+    # Standard-Transport: direkter HTTP-Aufruf, damit die Rate-Limit-Header lesbar sind
+    api_base = (api_base or os.getenv("GENERATION_API_BASE") or GENERATION_API_BASE).rstrip("/")
+
+    def send(api_key, model, prompt, max_tokens):
+        headers = {"Authorization": f"Bearer {api_key.key}", "Content-Type": "application/json"}
+        if api_key.organization:
+            headers["OpenAI-Organization"] = api_key.organization
+
+        body = json.dumps({"model": model, "prompt": prompt, "max_tokens": max_tokens}).encode("utf-8")
+        request = urllib.request.Request(f"{api_base}/completions", data=body, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                response_headers = {name.lower(): value for name, value in response.headers.items()}
+                data = json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                response_headers = {name.lower(): value for name, value in e.headers.items()}
+                raise RateLimitExceeded(
+                    f"Rate-Limit für {mask_key(api_key.key)} / {model}: {e.read().decode('utf-8', 'replace')}",
+                    response_headers)
+            if e.code in (408, 409) or e.code >= 500:
+                raise TransientRequestError(f"HTTP {e.code} für {mask_key(api_key.key)} / {model}") from e
+            raise
+        except (urllib.error.URLError, socket.timeout, ConnectionError) as e:
+            raise TransientRequestError(f"Keine Antwort für {mask_key(api_key.key)} / {model}: {e}") from e
+        return CompletionResult(data["choices"][0]["text"], response_headers)
+
+    return send
+
+
+class _Budget:
+    # Spielraum eines Schlüssels für ein Modell
+
+    def __init__(self):
+        self.limit_requests = None
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.blocked_until = 0.0
+        self.in_flight = 0
+
+    def rate_limited(self, now, tokens):
+        if self.blocked_until > now:
+            return True
+        if self.remaining_requests is not None and self.requests_reset_at > now \
+                and self.remaining_requests <= self.in_flight:
+            return True
+        if self.remaining_tokens is not None and self.tokens_reset_at > now \
+                and self.remaining_tokens < tokens:
+            return True
+        return False
+
+    def headroom(self, now):
+        # Anteil der noch erlaubten Anfragen am Kontingent (abzüglich laufender Anfragen);
+        # unbekannte oder abgelaufene Fenster zählen als voll
+        if self.remaining_requests is None or self.requests_reset_at <= now:
+            return 1.0
+        limit = max(self.limit_requests or 0, self.remaining_requests, 1)
+        return (self.remaining_requests - self.in_flight) / limit
+
+    def next_change(self, now):
+        times = [t for t in (self.blocked_until, self.requests_reset_at, self.tokens_reset_at) if t > now]
+        return min(times) if times else None
+
+    def update(self, headers, now):
+        limit_requests = _header_int(headers, "x-ratelimit-limit-requests")
+        if limit_requests is not None:
+            self.limit_requests = limit_requests
+
+        remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests")
+        if remaining_requests is not None:
+            self.remaining_requests = remaining_requests
+            self.requests_reset_at = now + (parse_reset_duration(
+                headers.get("x-ratelimit-reset-requests")) or DEFAULT_RETRY_AFTER)
+
+        remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None:
+            self.remaining_tokens = remaining_tokens
+            self.tokens_reset_at = now + (parse_reset_duration(
+                headers.get("x-ratelimit-reset-tokens")) or DEFAULT_RETRY_AFTER)
+
+    def block(self, headers, now):
+        wait = parse_reset_duration(headers.get("retry-after")) \
+            or parse_reset_duration(headers.get("x-ratelimit-reset-requests")) \
+            or DEFAULT_RETRY_AFTER
+        self.blocked_until = max(self.blocked_until, now + wait)
+
+
+class RequestScheduler:
+
+    def __init__(self, api_keys, models, send=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                 max_tokens=GENERATION_MAX_TOKENS, clock=time.monotonic):
+        if not api_keys:
+            raise ValueError("Mindestens ein API-Schlüssel wird benötigt.")
+        if not models:
+            raise ValueError("Mindestens ein Modell wird benötigt.")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight muss mindestens 1 sein.")
+
+        self.api_keys = list(api_keys)
+        self.models = list(models)
+        self.send = send or http_completion()
+        self.max_in_flight = max_in_flight
+        self.max_tokens = max_tokens
+        self.clock = clock
+        self._budgets = {(index, model): _Budget()
+                         for index in range(len(self.api_keys)) for model in self.models}
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls, send=None):
+        return cls(load_api_keys(), load_generation_models(), send=send, max_in_flight=load_max_in_flight())
+
+    def _estimate_tokens(self, prompt):
+        return len(prompt) // CHARS_PER_TOKEN + self.max_tokens
+
+    def _pick(self, tokens, now):
+        # Liefert (Schlüssel-Index, Modell) oder None, wenn gewartet werden muss
+        for model in self.models:
+            candidates = []
+            busy = False
+            for index in range(len(self.api_keys)):
+                budget = self._budgets[(index, model)]
+                if budget.rate_limited(now, tokens):
+                    continue
+                if budget.in_flight >= self.max_in_flight:
+                    busy = True
+                    continue
+                # Größter verbleibender Anteil am Kontingent zuerst, dann weniger laufende
+                # Anfragen, bei Gleichstand der Schlüssel mit kleinerem Index
+                candidates.append((budget.headroom(now), -budget.in_flight, -index))
+
+            if candidates:
+                _, _, index = max(candidates)
+                return -index, model
+            if busy:
+                # Nur ausgelastet, nicht am Limit: lieber warten als auf ein schwächeres Modell ausweichen
+                return None
+        return None
+
+    def _acquire(self, prompt):
+        tokens = self._estimate_tokens(prompt)
+        with self._condition:
+            while True:
+                now = self.clock()
+                choice = self._pick(tokens, now)
+                if choice:
+                    self._budgets[choice].in_flight += 1
+                    return choice
+
+                changes = [t for t in (budget.next_change(now) for budget in self._budgets.values()) if t]
+                timeout = min(changes) - now if changes else None
+                self._condition.wait(timeout)
+
+    def _release(self, choice, headers=None, rate_limited=False):
+        with self._condition:
+            budget = self._budgets[choice]
+            budget.in_flight -= 1
+            now = self.clock()
+            if headers:
+                budget.update(headers, now)
+            if rate_limited:
+                budget.block(headers or {}, now)
+            self._condition.notify_all()
+
+    def _generate_one(self, prompt):
+        rate_limit_retries = transient_retries = 0
+        while True:
+            index, model = choice = self._acquire(prompt)
+            api_key = self.api_keys[index]
+            try:
+                result = self.send(api_key, model, prompt, self.max_tokens)
+            except RateLimitExceeded as e:
+                self._release(choice, e.headers, rate_limited=True)
+                rate_limit_retries += 1
+                if rate_limit_retries > MAX_RATE_LIMIT_RETRIES:
+                    raise RateLimitExceeded(
+                        f"Anfrage nach {rate_limit_retries} Versuchen weiterhin am Rate-Limit.", e.headers)
+                continue
+            except (TransientRequestError, socket.timeout, ConnectionError) as e:
+                self._release(choice)
+                transient_retries += 1
+                if transient_retries > MAX_TRANSIENT_RETRIES:
+                    raise
+                wait = min(MAX_TRANSIENT_BACKOFF, TRANSIENT_BACKOFF * 2 ** (transient_retries - 1))
+                custom_print(
+                    f"{e} - neuer Versuch {transient_retries}/{MAX_TRANSIENT_RETRIES} in {wait:.0f} s.", LogLevel.INFO)
+                time.sleep(wait)
+                continue
+            except BaseException:
+                self._release(choice)
+                raise
+            self._release(choice, result.headers)
+            return GenerationResult(result.text, model, mask_key(api_key.key))
+
+    def _generate_or_error(self, prompt):
+        # Ein endgültig fehlgeschlagener Abschnitt darf die übrigen (bereits bezahlten) nicht verwerfen
+        try:
+            return self._generate_one(prompt)
+        except Exception as e:
+            return GenerationResult(None, None, None, error=str(e) or type(e).__name__)
+
+    def generate(self, prompts):
+        # Ergebnisse kommen unabhängig von der Bearbeitungsreihenfolge in Reihenfolge der Prompts zurück
+        prompts = list(prompts)
+        if not prompts:
+            return []
+
+        workers = min(len(prompts), len(self.api_keys) * self.max_in_flight)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(self._generate_or_error, prompts))
+
+
+def generate_completions(prompts, send=None):
+    scheduler = RequestScheduler.from_env(send=send)
+    custom_print(
+        f"Generierung mit {len(scheduler.api_keys)} Schlüssel(n), Modelle: {', '.join(scheduler.models)}", LogLevel.INFO)
+    return scheduler.generate(prompts)
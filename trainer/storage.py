@@ -0,0 +1,215 @@
+import os
+import gzip
+import hashlib
+import lzma
+import shutil
+import tempfile
+import time
+from config import FINE_TUNE_DIR, RAW_DATA_DIR, PREPARED_DATA_DIR, UNPACKED_DATA_DIR
+from utils import LogLevel, custom_print, print_header, create_directory
+
+try:
+    import zstandard
+except ImportError:  # optional: pip install zstandard
+    zstandard = None
+
+# Komprimierte Varianten werden ausschließlich an der Dateiendung erkannt (z.B. daten.jsonl.gz)
+GZIP_SUFFIX = ".gz"
+XZ_SUFFIX = ".xz"
+ZSTD_SUFFIX = ".zst"
+COMPRESSION_SUFFIXES = (GZIP_SUFFIX, XZ_SUFFIX, ZSTD_SUFFIX)
+
+# Namen für die Umgebungsvariable DATA_COMPRESSION
+COMPRESSION_NAMES = {
+    "": "", "none": "",
+    "gz": GZIP_SUFFIX, "gzip": GZIP_SUFFIX,
+    "xz": XZ_SUFFIX, "lzma": XZ_SUFFIX,
+    "zst": ZSTD_SUFFIX, "zstd": ZSTD_SUFFIX,
+}
+
+GZIP_LEVEL = 6
+XZ_PRESET = 6
+ZSTD_LEVEL = 3
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def split_compression(filename):
+    # "daten.jsonl.gz" -> ("daten.jsonl", ".gz")
+    for suffix in COMPRESSION_SUFFIXES:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)], suffix
+    return filename, ""
+
+
+def has_data_extension(filename, extension):
+    return split_compression(filename)[0].endswith(extension)
+
+
+def data_basename(path):
+    # Dateiname ohne Komprimierungs- und Datenendung: ".../daten.txt.xz" -> "daten"
+    return os.path.splitext(split_compression(os.path.basename(path))[0])[0]
+
+
+def existing_variants(path):
+    # Alle vorhandenen Varianten derselben Datei: daten.jsonl, daten.jsonl.gz, ...
+    plain_path = split_compression(path)[0]
+    return [plain_path + suffix for suffix in ("",) + COMPRESSION_SUFFIXES
+            if os.path.exists(plain_path + suffix)]
+
+
+def remove_other_variants(path):
+    # Nach dem Überschreiben darf nur noch eine Variante übrig bleiben, sonst taucht
+    # derselbe Inhalt doppelt in Auflistungen, Zusammenführungen und im Fragen-Index auf
+    for variant in existing_variants(path):
+        if variant != path:
+            os.remove(variant)
+
+
+def list_data_files(directory, extension):
+    return [f for f in os.listdir(directory)
+            if os.path.isfile(os.path.join(directory, f)) and has_data_extension(f, extension)]
+
+
+def default_compression_suffix():
+    name = os.getenv("DATA_COMPRESSION", "").strip().lower()
+    if name not in COMPRESSION_NAMES:
+        raise ValueError(
+            f"Unbekannte Komprimierung '{name}' in DATA_COMPRESSION (erlaubt: gzip, xz, zstd).")
+    suffix = COMPRESSION_NAMES[name]
+    if suffix == ZSTD_SUFFIX and zstandard is None:
+        raise ImportError(
+            "DATA_COMPRESSION=zstd benötigt das Paket 'zstandard' (pip install zstandard).")
+    return suffix
+
+
+def check_data_compression():
+    # Beim Programmstart prüfen, damit ein Fehler nicht erst beim Speichern nach der
+    # (kostenpflichtigen) Generierung auffällt; im Fehlerfall wird unkomprimiert gespeichert
+    try:
+        return default_compression_suffix()
+    except (ValueError, ImportError) as e:
+        custom_print(f"{e} Neue Dateien werden unkomprimiert gespeichert.", LogLevel.ERROR)
+        os.environ["DATA_COMPRESSION"] = "none"
+        return ""
+
+
+def open_data_file(path, mode='r', encoding='utf-8'):
+    # Wie open(), aber .gz/.xz/.zst werden beim Lesen und Schreiben transparent (de)komprimiert
+    binary = 'b' in mode
+    raw_mode = mode.replace('t', '').replace('b', '')
+    kwargs = {} if binary else {"encoding": encoding}
+    stream_mode = raw_mode + ('b' if binary else 't')
+
+    suffix = split_compression(path)[1]
+    if suffix == GZIP_SUFFIX:
+        if raw_mode != 'r':
+            kwargs["compresslevel"] = GZIP_LEVEL
+        return gzip.open(path, stream_mode, **kwargs)
+    if suffix == XZ_SUFFIX:
+        if raw_mode != 'r':
+            kwargs["preset"] = XZ_PRESET
+        return lzma.open(path, stream_mode, **kwargs)
+    if suffix == ZSTD_SUFFIX:
+        if zstandard is None:
+            raise ImportError(
+                f"Für '{path}' wird das Paket 'zstandard' benötigt (pip install zstandard).")
+        if raw_mode != 'r':
+            kwargs["cctx"] = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return zstandard.open(path, stream_mode, **kwargs)
+    return open(path, mode, **kwargs)
+
+
+def ensure_plain_file(path):
+    # Externe Werkzeuge (openai CLI) lesen nur unkomprimierte Dateien
+    plain_name, suffix = split_compression(os.path.basename(path))
+    if not suffix:
+        return path
+
+    # Name enthält einen Hash des absoluten Quellpfads und das Format der Quelle, damit
+    # gleichnamige Archive aus verschiedenen Ordnern sich nicht eine Kopie teilen:
+    # sem1/a.jsonl.gz -> a.<hash>.gz.jsonl
+    stem, extension = os.path.splitext(plain_name)
+    source_hash = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:10]
+    create_directory(UNPACKED_DATA_DIR)
+    plain_path = os.path.join(UNPACKED_DATA_DIR, f"{stem}.{source_hash}{suffix}{extension}")
+
+    # Größe und Änderungszeit der Quelle beim Entpacken; jede Abweichung (auch ein älteres
+    # Archiv an derselben Stelle) erzwingt ein erneutes Entpacken
+    source_stat = os.stat(path)
+    source_state = f"{source_stat.st_size} {source_stat.st_mtime_ns}"
+    state_path = plain_path + ".source"
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            up_to_date = f.read().strip() == source_state and os.path.exists(plain_path)
+    except OSError:
+        up_to_date = False
+
+    if not up_to_date:
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        # Erst vollständig entpacken, dann ersetzen: kein halb geschriebener Stand für die CLI
+        tmp_path = plain_path + ".tmp"
+        with open_data_file(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(tmp_path, plain_path)
+        with open(state_path, 'w', encoding='utf-8') as f:
+            f.write(source_state)
+        custom_print(
+            f"'{path}' wurde für externe Werkzeuge nach '{plain_path}' entpackt.", LogLevel.INFO)
+    return plain_path
+
+
+def _benchmark_sample():
+    # Alle vorhandenen Roh- und Trainingsdaten (entpackt) als Stichprobe
+    sample = bytearray()
+    for directory, extension in ((RAW_DATA_DIR, ".txt"), (PREPARED_DATA_DIR, ".jsonl")):
+        for filename in sorted(list_data_files(directory, extension)):
+            with open_data_file(os.path.join(directory, filename), 'rb') as f:
+                sample.extend(f.read())
+    return bytes(sample)
+
+
+def benchmark_storage_codecs(rounds=3):
+    print_header("Benchmark der Speicherformate (gzip/xz/zstd)")
+
+    sample = _benchmark_sample()
+    if not sample:
+        custom_print(
+            f"Keine Daten in '{RAW_DATA_DIR}' oder '{PREPARED_DATA_DIR}' gefunden.", LogLevel.ERROR)
+        return
+
+    suffixes = ["", GZIP_SUFFIX, XZ_SUFFIX]
+    if zstandard is not None:
+        suffixes.append(ZSTD_SUFFIX)
+    else:
+        custom_print(
+            "zstd wird übersprungen (Paket 'zstandard' nicht installiert).", LogLevel.INFO)
+
+    size_mb = len(sample) / (1024 * 1024)
+    custom_print(f"\nStichprobe: {len(sample)} Bytes, {rounds} Durchläufe\n", LogLevel.INFO)
+    print(f"{'Format':<8}{'Größe (Bytes)':>16}{'Anteil':>10}{'Schreiben MB/s':>18}{'Lesen MB/s':>14}")
+
+    # Auf demselben Speicher messen, auf dem die Daten liegen (z.B. Netzlaufwerk)
+    with tempfile.TemporaryDirectory(dir=FINE_TUNE_DIR) as tmp_dir:
+        for suffix in suffixes:
+            path = os.path.join(tmp_dir, "sample.jsonl" + suffix)
+            write_time = read_time = float("inf")
+
+            # Bester Durchlauf zählt, damit Ausreißer (Cache, Netzwerk) das Ergebnis nicht verfälschen
+            for _ in range(rounds):
+                start = time.perf_counter()
+                with open_data_file(path, 'wb') as f:
+                    for offset in range(0, len(sample), CHUNK_SIZE):
+                        f.write(sample[offset:offset + CHUNK_SIZE])
+                write_time = min(write_time, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                with open_data_file(path, 'rb') as f:
+                    while f.read(CHUNK_SIZE):
+                        pass
+                read_time = min(read_time, time.perf_counter() - start)
+
+            disk_size = os.path.getsize(path)
+            print(f"{suffix or 'plain':<8}{disk_size:>16}{disk_size / len(sample):>10.1%}"
+                  f"{size_mb / write_time:>18.1f}{size_mb / read_time:>14.1f}")